@@ -84,11 +84,21 @@ class DRLagent2:
             idx = random.randrange(len(afterstates))
             return idx, []
 
+        values = self.evaluate(afterstates)
+        idx = int(np.argmax(values))
+        return idx, values
+
+    def evaluate(self, afterstates):
+        """
+        afterstates: list[np.ndarray] each shape (state_dim,)
+        Returns: list[float] of net values, one batched forward pass
+        """
+        if not afterstates:
+            return []
         with torch.no_grad():
             x = torch.tensor(np.stack(afterstates), dtype=torch.float32, device=self.device)
             v = self.net(x)  # (N,)
-            idx = torch.argmax(v).item()
-        return idx, v.detach().cpu().numpy().tolist()
+        return v.detach().cpu().numpy().tolist()
 
     def remember(self, sa, r, sn, done):
         self.buffer.append(Transition(sa, r, sn, done))
@@ -0,0 +1,432 @@
+"""
+Local load test: start server.py under uvicorn and drive simulated players
+through the same turn cycle as app.js (new -> roll -> legal -> move/human or
+move/ai) picking random legal paths, then report throughput, per-route
+latency percentiles, error rates, server CPU/memory (PSS) and the load
+generator's own CPU.
+
+    python loadtest.py --players 32 --duration 30 --workers 4 --procs 4
+    python loadtest.py --url http://127.0.0.1:8000 --players 8   # existing server
+
+GAMES is per process, so with --workers > 1 a game only works while its
+player stays on one keep-alive connection. The local server is started with
+a keep-alive timeout above --think to hold that; reconnects are counted as
+affinity losses. Multi-worker numbers therefore rely on connection pinning
+that real browsers do not guarantee.
+
+Players are threads, so one client process tops out around one core; when
+the report warns about client CPU, rps and p99 measure the harness rather
+than the server, so raise --procs.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+ROUTES = ["/game/new", "/game/roll", "/game/legal", "/game/move/human", "/game/move/ai"]
+
+# -------- stats --------
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency: Dict[str, List[float]] = defaultdict(list)   # seconds, successes only
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.games = 0
+        self.reconnects = 0       # a game's connection was replaced: may land on another worker
+
+    def record(self, route: str, dt: float, ok: bool):
+        with self.lock:
+            if ok:
+                self.latency[route].append(dt)
+            else:
+                self.errors[route] += 1
+
+    def game_done(self):
+        with self.lock:
+            self.games += 1
+
+    def reconnect(self):
+        with self.lock:
+            self.reconnects += 1
+
+def percentile(xs: List[float], q: float) -> float:
+    if not xs:
+        return 0.0
+    xs = sorted(xs)
+    k = min(len(xs) - 1, max(0, int(round(q / 100.0 * (len(xs) - 1)))))
+    return xs[k]
+
+# -------- server process sampling (Linux /proc) --------
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def process_tree(root: int) -> List[int]:
+    # uvicorn --workers spawns children, so sum over every descendant
+    parents = {}
+    for d in os.listdir("/proc"):
+        if not d.isdigit():
+            continue
+        try:
+            with open(f"/proc/{d}/stat") as f:
+                # comm may contain spaces; fields after ')' are fixed
+                rest = f.read().rsplit(")", 1)[1].split()
+            parents[int(d)] = int(rest[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    tree, frontier = [root], [root]
+    while frontier:
+        p = frontier.pop()
+        kids = [c for c, pp in parents.items() if pp == p]
+        tree += kids; frontier += kids
+    return tree
+
+def pss(pid: int) -> Optional[int]:
+    # proportional set size: pages shared between workers (torch, the model)
+    # are split between them instead of counted once per process
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for ln in f:
+                if ln.startswith("Pss:"):
+                    return int(ln.split()[1]) * 1024
+    except (OSError, IndexError, ValueError):
+        pass
+    return None
+
+def cpu_mem(pids: List[int]):
+    """Total CPU seconds and memory bytes; exact is False if any PSS fell back to RSS."""
+    ticks, mem, exact = 0, 0, True
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                rest = f.read().rsplit(")", 1)[1].split()
+            ticks += int(rest[11]) + int(rest[12])       # utime + stime
+            p = pss(pid)
+            if p is None:                                # no smaps_rollup: RSS, an upper bound
+                with open(f"/proc/{pid}/statm") as f:
+                    p = int(f.read().split()[1]) * PAGE
+                exact = False
+            mem += p
+        except (OSError, IndexError, ValueError):
+            continue
+    return ticks / CLK_TCK, mem, exact
+
+class Sampler(threading.Thread):
+    def __init__(self, pid: int, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.pid, self.interval = pid, interval
+        self.cpu: List[float] = []    # % of one core
+        self.mem: List[int] = []      # bytes, PSS summed over the tree
+        self.mem_exact = True
+        self.stop = threading.Event()
+
+    def run(self):
+        last_cpu, _, _ = cpu_mem(process_tree(self.pid))
+        last_t = time.monotonic()
+        while not self.stop.wait(self.interval):
+            c, m, exact = cpu_mem(process_tree(self.pid))
+            t = time.monotonic()
+            self.cpu.append(100.0 * (c - last_cpu) / max(t - last_t, 1e-9))
+            self.mem.append(m)
+            self.mem_exact = self.mem_exact and exact
+            last_cpu, last_t = c, t
+
+# -------- simulated player --------
+class ApiError(Exception):
+    pass
+
+def connection(scheme: str, host: str, port: int, timeout: float) -> http.client.HTTPConnection:
+    cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+    return cls(host, port, timeout=timeout)
+
+class Client:
+    def __init__(self, scheme: str, host: str, port: int, stats: Stats, timeout: float):
+        self.scheme, self.host, self.port, self.timeout = scheme, host, port, timeout
+        self.stats = stats
+        self.conn = None
+        self.game_open = False    # a game lives on the worker behind this connection
+
+    def _open(self, route: str):
+        if self.conn is not None and self.conn.sock is not None:
+            return
+        # first use, dropped after an error, or closed by the server (Connection: close)
+        if self.game_open and route != "/game/new":
+            self.stats.reconnect()
+        if self.conn is None:
+            self.conn = connection(self.scheme, self.host, self.port, self.timeout)
+        self.conn.connect()
+        self.conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _drop(self):
+        if self.conn is not None:
+            self.conn.close()
+        self.conn = None
+
+    def post(self, route: str, body: dict, *need: str) -> dict:
+        """POST and return the JSON body; errors (incl. missing `need` keys) raise ApiError."""
+        # bytes body goes out in the same send() as the headers (avoids Nagle/delayed-ACK stalls)
+        payload = json.dumps(body).encode()
+        for attempt in (0, 1):
+            t0 = time.perf_counter()
+            try:
+                reused = self.conn is not None and self.conn.sock is not None
+                self._open(route)
+                self.conn.request("POST", route, payload, {"Content-Type": "application/json"})
+                r = self.conn.getresponse()
+                data = r.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                # server closed an idle keep-alive connection: not a server error,
+                # reconnect once (counted as an affinity loss) and resend
+                self._drop()
+                if reused and attempt == 0:
+                    continue
+                self.stats.record(route, time.perf_counter() - t0, False)
+                raise ApiError(f"{route}: {e}")
+            except (OSError, http.client.HTTPException) as e:
+                self.stats.record(route, time.perf_counter() - t0, False)
+                self._drop()
+                raise ApiError(f"{route}: {e}")
+        dt = time.perf_counter() - t0
+        if not 200 <= r.status < 300:
+            self.stats.record(route, dt, False)
+            raise ApiError(f"{route}: HTTP {r.status} {data[:200]!r}")
+        try:
+            j = json.loads(data)
+            missing = [k for k in need if k not in j]
+        except (ValueError, TypeError):
+            j, missing = None, ["<json object>"]
+        self.stats.record(route, dt, not missing)
+        if missing:
+            raise ApiError(f"{route}: bad response, missing {missing}: {data[:200]!r}")
+        return j
+
+    def close(self):
+        self._drop()
+
+def play(client: Client, rng: random.Random, stop: threading.Event, think: float, max_turns: int):
+    """One game, same call order as app.js. Returns when done, stopped or capped."""
+    client.game_open = False
+    j = client.post("/game/new", {"ai_side": rng.choice(["ONE", "TWO"])}, "game_id")
+    gid = j["game_id"]
+    client.game_open = True
+    for _ in range(max_turns):
+        if stop.is_set():
+            return
+        j = client.post("/game/roll", {"game_id": gid}, "dice")
+        dice = j["dice"]
+        leg = client.post("/game/legal", {"game_id": gid}, "turn", "paths")
+        if think: time.sleep(think)
+        if leg["turn"] == "HUMAN":
+            paths = leg["paths"] or [[]]                 # [] means PASS
+            j = client.post("/game/move/human", {"game_id": gid, "dice": dice, "path": rng.choice(paths)}, "done")
+        else:
+            j = client.post("/game/move/ai", {"game_id": gid, "dice": dice}, "done")
+        if j["done"]:
+            client.stats.game_done()
+            return
+
+def player_loop(scheme, host, port, stats, stop, seed, think, timeout, max_turns):
+    rng = random.Random(seed)
+    client = Client(scheme, host, port, stats, timeout)
+    try:
+        while not stop.is_set():
+            try:
+                play(client, rng, stop, think, max_turns)
+            except ApiError:
+                # abandon this game and start a fresh one
+                time.sleep(0.05)
+    finally:
+        client.close()
+
+def run_players(scheme, host, port, seeds, think, timeout, max_turns, duration) -> dict:
+    """One client process: a thread per seed for `duration` s. Returns picklable stats."""
+    stats, stop = Stats(), threading.Event()
+    threads = [threading.Thread(target=player_loop, daemon=True,
+                                args=(scheme, host, port, stats, stop, seed,
+                                      think, timeout, max_turns))
+               for seed in seeds]
+    ru0 = resource.getrusage(resource.RUSAGE_SELF)
+    t0 = time.monotonic()
+    for t in threads: t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads: t.join(timeout)
+    elapsed = time.monotonic() - t0
+    ru1 = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        "latency": dict(stats.latency), "errors": dict(stats.errors),
+        "games": stats.games, "reconnects": stats.reconnects, "elapsed": elapsed,
+        "cpu_s": (ru1.ru_utime + ru1.ru_stime) - (ru0.ru_utime + ru0.ru_stime),
+    }
+
+def merge(parts: List[dict]) -> Stats:
+    stats = Stats()
+    for p in parts:
+        for r, xs in p["latency"].items(): stats.latency[r] += xs
+        for r, n in p["errors"].items():   stats.errors[r] += n
+        stats.games += p["games"]
+        stats.reconnects += p["reconnects"]
+    return stats
+
+# -------- server lifecycle --------
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(port: int, workers: int, think: float) -> subprocess.Popen:
+    # keep idle connections open across a think pause so games stay on their worker
+    keep_alive = max(5, int(think) + 5)
+    cmd = [sys.executable, "-m", "uvicorn", "server:app",
+           "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(workers), "--timeout-keep-alive", str(keep_alive),
+           "--log-level", "warning"]
+    return subprocess.Popen(cmd, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+def wait_ready(scheme: str, host: str, port: int, proc: Optional[subprocess.Popen], timeout: float):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if proc is not None and proc.poll() is not None:
+            raise SystemExit(f"server exited with code {proc.returncode}")
+        try:
+            c = connection(scheme, host, port, 2)
+            c.request("GET", "/")                         # SPA index, no game created
+            if c.getresponse().status == 200:
+                c.close(); return
+        except OSError:
+            pass
+        time.sleep(0.25)
+    raise SystemExit("server did not become ready in time")
+
+# -------- report --------
+CLIENT_CPU_WARN = 80.0   # % of one core per client process
+
+def report(stats: Stats, elapsed: float, sampler: Optional[Sampler], client_cpu: List[float], args) -> dict:
+    total_ok = sum(len(v) for v in stats.latency.values())
+    total_err = sum(stats.errors.values())
+    total = total_ok + total_err
+    routes = {}
+    for r in ROUTES:
+        lat, err = stats.latency.get(r, []), stats.errors.get(r, 0)
+        n = len(lat) + err
+        routes[r] = {
+            "requests": n,
+            "error_rate": err / n if n else 0.0,
+            "p50_ms": 1000 * percentile(lat, 50),
+            "p90_ms": 1000 * percentile(lat, 90),
+            "p99_ms": 1000 * percentile(lat, 99),
+            "max_ms": 1000 * max(lat, default=0.0),
+        }
+    out = {
+        "players": args.players, "workers": None if args.url else args.workers, "elapsed_s": elapsed,
+        "requests": total, "rps": total / elapsed if elapsed else 0.0,
+        "error_rate": total_err / total if total else 0.0,
+        "games_finished": stats.games, "reconnects": stats.reconnects, "routes": routes,
+        "client": {
+            "procs": len(client_cpu),
+            "cpu_pct": client_cpu,                       # per process, % of one core
+            "saturated": max(client_cpu, default=0.0) >= CLIENT_CPU_WARN,
+        },
+    }
+    if sampler is not None and sampler.cpu:
+        out["server"] = {
+            "cpu_avg_pct": sum(sampler.cpu) / len(sampler.cpu),
+            "cpu_peak_pct": max(sampler.cpu),
+            "mem_peak_mb": max(sampler.mem) / 2**20,
+            "mem_kind": "pss" if sampler.mem_exact else "rss (upper bound)",
+        }
+    return out
+
+def print_report(r: dict):
+    print(f"\nplayers={r['players']} workers={r['workers']} elapsed={r['elapsed_s']:.1f}s "
+          f"games={r['games_finished']}")
+    print(f"requests={r['requests']}  rps={r['rps']:.1f}  errors={100 * r['error_rate']:.2f}%  "
+          f"reconnects={r['reconnects']} (mid-game, affinity lost)")
+    print(f"{'route':<18}{'reqs':>8}{'err%':>8}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}  (ms)")
+    for name, s in r["routes"].items():
+        print(f"{name:<18}{s['requests']:>8}{100 * s['error_rate']:>8.2f}"
+              f"{s['p50_ms']:>9.1f}{s['p90_ms']:>9.1f}{s['p99_ms']:>9.1f}{s['max_ms']:>9.1f}")
+    if "server" in r:
+        s = r["server"]
+        print(f"server cpu avg={s['cpu_avg_pct']:.0f}% peak={s['cpu_peak_pct']:.0f}% "
+              f"(100% = one core)  {s['mem_kind']} peak={s['mem_peak_mb']:.0f} MB")
+    c = r["client"]
+    print(f"client procs={c['procs']} cpu=" + " ".join(f"{x:.0f}%" for x in c["cpu_pct"]))
+    if c["saturated"]:
+        print(f"WARNING: a client process is above {CLIENT_CPU_WARN:.0f}% of one core; "
+              f"rps and latencies measure the load generator, raise --procs")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--players", type=int, default=16, help="concurrent simulated players")
+    ap.add_argument("--procs", type=int, default=1, help="client processes to spread players over")
+    ap.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    ap.add_argument("--workers", type=int, default=1, help="uvicorn workers for the local server")
+    ap.add_argument("--port", type=int, default=0, help="local server port (0 = pick a free one)")
+    ap.add_argument("--url", default=None, help="target an already running server instead")
+    ap.add_argument("--think", type=float, default=0.0, help="seconds a player waits before moving")
+    ap.add_argument("--timeout", type=float, default=30.0, help="per-request timeout (s)")
+    ap.add_argument("--max-turns", type=int, default=500, help="abandon a game after this many turns")
+    ap.add_argument("--startup-timeout", type=float, default=120.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", default=None, help="also write the report to this file")
+    args = ap.parse_args(argv)
+
+    proc = None
+    if args.url:
+        u = urlparse(args.url)
+        if u.scheme not in ("http", "https") or not u.hostname:
+            ap.error(f"--url must be http:// or https://, got {args.url!r}")
+        scheme, host = u.scheme, u.hostname
+        port = u.port or (443 if scheme == "https" else 80)
+    else:
+        scheme, host, port = "http", "127.0.0.1", args.port or free_port()
+        proc = start_server(port, args.workers, args.think)
+
+    sampler = None
+    try:
+        wait_ready(scheme, host, port, proc, args.startup_timeout)
+        if proc is not None and os.path.isdir("/proc"):
+            sampler = Sampler(proc.pid); sampler.start()
+
+        procs = max(1, min(args.procs, args.players))
+        jobs = [(scheme, host, port, [args.seed + i for i in range(k, args.players, procs)],
+                 args.think, args.timeout, args.max_turns, args.duration)
+                for k in range(procs)]
+        if procs == 1:
+            parts = [run_players(*jobs[0])]
+        else:
+            with multiprocessing.get_context("spawn").Pool(procs) as pool:
+                parts = pool.starmap(run_players, jobs)
+        stats = merge(parts)
+        elapsed = max(p["elapsed"] for p in parts)
+        client_cpu = [100.0 * p["cpu_s"] / p["elapsed"] for p in parts]
+    finally:
+        if sampler is not None:
+            sampler.stop.set()
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    r = report(stats, elapsed, sampler, client_cpu, args)
+    print_report(r)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(r, f, indent=2)
+
+if __name__ == "__main__":
+    main()
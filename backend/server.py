@@ -1,19 +1,25 @@
 """
 @author: ranger
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Optional
 import uuid, random
-import os
+import os, json, time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from player import Player
 
 player_win = 0
 ai_win = 0
 
+ANALYZE_DEADLINE = 5.0   # seconds; soft deadline for the 2-ply refinement of /game/analyze
+ANALYZE_CONCURRENCY = 2  # analyses running at once (the real CPU bound); more get 429
+
 ROOT = os.path.join(os.path.dirname(__file__), "static_site")
 
 # -------- models --------
@@ -32,6 +38,10 @@ class AiMoveReq(BaseModel):
     game_id: str
     dice: Tuple[int, int]
 
+class AnalyzeReq(BaseModel):
+    game_id: str
+    deadline_ms: Optional[int] = None   # capped at ANALYZE_DEADLINE
+
 # -------- app --------
 app = FastAPI()
 
@@ -163,6 +173,58 @@ def enumerate_paths(player: Player, state: List[int], d1: int, d2: int) -> List[
     return list(seen.values())
 
 
+# -------- position analysis (hints) --------
+# the 21 distinct rolls with their probability out of 36
+ROLLS = [((a, b), 1 if a == b else 2) for a in range(1, 7) for b in range(a, 7)]
+
+# own threads keep the sync endpoints' threadpool free, but enumerate_paths holds
+# the GIL, so analyses still slow the game down; ANALYZE_CONCURRENCY is the cap
+ANALYZE_POOL = ThreadPoolExecutor(max_workers=ANALYZE_CONCURRENCY)
+analyze_running = 0
+
+def rank_key(m: Dict[str, Any]):
+    return (m["win"], m["equity"])              # immediate wins always on top
+
+def refined_key(m: Dict[str, Any]):
+    # wins compare among themselves by net value, the rest by ply2_score
+    return (m["win"], m["equity"] if m["win"] else m["ply2_score"])
+
+def rank_moves(player: Player, state: List[int], d1: int, d2: int) -> List[Dict[str, Any]]:
+    """1-ply: every legal path scored by ValueNet in one batched pass, best first."""
+    paths = enumerate_paths(player, state, d1, d2)
+    s_afters = [player.apply_path(state.copy(), p) for p in paths]
+    values = player.brain.evaluate([player.flatten(s) for s in s_afters])
+    moves = [{"path": p, "equity": v, "ply": 1, "win": s[1] == 15, "ply2_score": None}
+             for p, s, v in zip(paths, s_afters, values)]
+    moves.sort(key=rank_key, reverse=True)
+    return moves
+
+def refine_move(player: Player, state: List[int], path, deadline: float) -> Optional[float]:
+    """
+    2-ply: average over all opponent rolls of the opponent's best reply,
+    negated back to our perspective. None if the deadline passes mid-way.
+    Not on the 1-ply equity scale (the net favours the side that just moved),
+    so only use it to order moves against each other.
+    """
+    s_opp = flip_state(player.apply_path(state.copy(), path))
+
+    afters, spans = [], []                      # spans: (start, end, weight) per roll
+    for (a, b), w in ROLLS:
+        if time.monotonic() >= deadline:
+            return None
+        replies = enumerate_paths(player, s_opp, a, b)
+        start = len(afters)
+        if replies:
+            afters += [player.flatten(player.apply_path(s_opp.copy(), p)) for p in replies]
+        else:
+            afters.append(player.flatten(s_opp))  # opponent passes
+        spans.append((start, len(afters), w))
+
+    values = player.brain.evaluate(afters)
+    total = sum(w * max(values[i:j]) for i, j, w in spans)
+    return -total / 36.0
+
+
 # -------- endpoints --------
 @app.post("/game/new")
 def new_game(req: NewGameReq):
@@ -293,3 +355,72 @@ def move_ai(req: AiMoveReq):
     return {"state": g["state"], "path": [], "done": done, "turn": g["turn"]}
 
 
+# ANALYZE: stream a 1-ply ranking, then 2-ply refinements as they finish (NDJSON)
+@app.post("/game/analyze")
+async def analyze(req: AnalyzeReq, request: Request):
+    g = GAMES.get(req.game_id)
+    if not g: raise HTTPException(404, "bad game_id")
+    if g["turn"] != "HUMAN": raise HTTPException(400, "not human's turn")
+    if not g.get("dice"):    raise HTTPException(400, "roll first")
+
+    # snapshot: the game may move on while we are still streaming
+    state = g["state"].copy()
+    d1, d2 = g["dice"]
+    budget = ANALYZE_DEADLINE
+    if req.deadline_ms is not None:
+        budget = min(budget, max(req.deadline_ms, 0) / 1000.0)
+    deadline = time.monotonic() + budget
+
+    # take the slot here, before the response starts; no await until it is held
+    global analyze_running
+    if analyze_running >= ANALYZE_CONCURRENCY:
+        raise HTTPException(429, "too many analyses running; try again")
+    analyze_running += 1
+    released = False
+
+    def release():
+        global analyze_running
+        nonlocal released
+        if not released:
+            released = True
+            analyze_running -= 1
+
+    def line(obj) -> str:
+        return json.dumps(obj) + "\n"
+
+    async def run(fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(ANALYZE_POOL, fn, *args)
+
+    async def stream():
+        try:
+            # the 1-ply pass always completes; the deadline only bounds refinement
+            moves = await run(rank_moves, AI, state, d1, d2)
+            yield line({"type": "ply1", "dice": [d1, d2], "moves": moves})
+
+            # refine best-first so a deadline cut still covers the top candidates
+            refined = 0
+            reason = None
+            for m in moves:
+                if await request.is_disconnected():
+                    return                          # client gone: stop burning CPU
+                if not m["win"]:                    # an immediate win needs no search
+                    score = await run(refine_move, AI, state, m["path"], deadline)
+                    if score is None:
+                        reason = "deadline"; break
+                    m["ply2_score"] = score
+                m["ply"] = 2
+                refined += 1
+                yield line({"type": "ply2", "path": m["path"], "equity": m["equity"],
+                            "ply2_score": m["ply2_score"], "win": m["win"]})
+
+            # equity stays the 1-ply net value; ply2_score only re-orders the
+            # refined prefix, unrefined moves follow in their 1-ply order
+            moves[:refined] = sorted(moves[:refined], key=refined_key, reverse=True)
+            yield line({"type": "done", "moves": moves, "refined": refined,
+                        "complete": refined == len(moves), "reason": reason})
+        finally:
+            release()
+
+    # background also runs when the body is never iterated (early disconnect)
+    return StreamingResponse(stream(), media_type="application/x-ndjson",
+                             background=BackgroundTask(release))